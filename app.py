@@ -18,6 +18,12 @@ app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# Section headers like "ORG 1.1", "ORG 2.1.1", etc., compiled once at import
+ORG_HEADER_PATTERN = re.compile(r'\b(ORG \d+(\.\d+){1,5})\b')
+
+# Shared OpenAI client, reused across requests so its HTTP connection pool is kept
+client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+
 # [Previous functions remain the same - extract_toc_and_sections, extract_section_with_gpt]
 
 def perform_audit(iosa_checklist: str, input_text: str) -> str:
@@ -32,12 +38,6 @@ def perform_audit(iosa_checklist: str, input_text: str) -> str:
     Returns:
         str: Audit results including assessment, recommendations, and compliance scores
     """
-    # Load the secrets from the toml file
-    
-
-    # Create the OpenAI client using the API key from secrets.toml
-    client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-
     # OpenAI API request
     response = client.chat.completions.create(
         model='gpt-4o',
@@ -121,17 +121,24 @@ def extract_toc_and_sections(pdf_path: str, expand_pages: int = 7) -> Dict[str,
     toc = doc.get_toc()  # Extract the Table of Contents (TOC)
     sections = {}
 
+    # Extract every page once up front; both scans below reuse these instead of
+    # re-loading the same pages for each TOC entry and header page
+    page_texts = []
+    section_page_texts = []
+    for i in range(len(doc)):
+        page = doc.load_page(i)
+        page_text = page.get_text("text")
+        page_texts.append(page_text)
+        if not page_text:
+            page_text = page.get_text("blocks")  # Try blocks if text is empty
+        section_page_texts.append(page_text if page_text else "Text not available for this section\n")
+
     # Create a dictionary to map TOC entries to text in the PDF
     for toc_entry in toc:
         level, title, page = toc_entry
         try:
             # Extract text from the starting page and the following pages
-            section_text = ""
-            for i in range(page - 1, min(page - 1 + expand_pages + 1, len(doc))):
-                page_text = doc.load_page(i).get_text("text")
-                if not page_text:
-                    page_text = doc.load_page(i).get_text("blocks")  # Try blocks if text is empty
-                section_text += page_text if page_text else "Text not available for this section\n"
+            section_text = "".join(section_page_texts[i % len(doc)] for i in range(page - 1, min(page - 1 + expand_pages + 1, len(doc))))
             
             # Check if the title already exists in sections, if so append to the list
             if title in sections:
@@ -162,36 +169,30 @@ def extract_toc_and_sections(pdf_path: str, expand_pages: int = 7) -> Dict[str,
 
     # Function to detect section headers like "ORG 1.1.1", "ORG 2.3.4", etc.
     def find_section_headers(page_text):
-        pattern = r'\b(ORG \d+(\.\d+){1,5})\b'  # Matches patterns like ORG 1.1, ORG 2.1.1, etc.
-        headers = re.findall(pattern, page_text)
-        return [header[0] for header in headers]
+        return [match.group(1) for match in ORG_HEADER_PATTERN.finditer(page_text)]
 
     # Scan each page for section headers not in the TOC
-    for page_num in range(len(doc)):
-        page_text = doc.load_page(page_num).get_text("text")
+    for page_num, page_text in enumerate(page_texts):
         headers = find_section_headers(page_text)
+        if not headers:
+            continue
+
+        # Every header on this page shares the same section text, so build it once per page
+        section_text = "".join(section_page_texts[page_num:page_num + expand_pages + 1]).strip()
 
         for header in headers:
-            # If header is not already in sections, add it
-            section_text = ""
-            for i in range(page_num, min(page_num + expand_pages + 1, len(doc))):
-                page_text = doc.load_page(i).get_text("text")
-                if not page_text:
-                    page_text = doc.load_page(i).get_text("blocks")  # Try blocks if text is empty
-                section_text += page_text if page_text else "Text not available for this section\n"
-            
             # Append this occurrence of the header to the list in sections
             if header in sections:
                 sections[header].append({
                     "level": header.count('.') + 1,  # Determine level by the number of dots
                     "page": page_num + 1,
-                    "text": section_text.strip()
+                    "text": section_text
                 })
             else:
                 sections[header] = [{
                     "level": header.count('.') + 1,
                     "page": page_num + 1,
-                    "text": section_text.strip()
+                    "text": section_text
                 }]
 
     return sections
@@ -207,9 +208,6 @@ def extract_section_with_gpt(section_name: str, chunk_text: str) -> str:
     Returns:
         str: Extracted section text
     """
-    # Initialize OpenAI client
-    client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-    
     # OpenAI API request
     response = client.chat.completions.create(
         model='gpt-4o',
@@ -238,6 +236,7 @@ def extract_section_with_gpt(section_name: str, chunk_text: str) -> str:
                 )
             }
         ],
+        temperature=0,  # Extraction should return the section verbatim, not a paraphrase
         max_tokens=4000  # Adjust token limit based on document size
     )
 
@@ -4,10 +4,12 @@ from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 import os
+import logging
 import uuid
 import time
 import json
 import re
+from functools import lru_cache
 from supabase import create_client, Client
 from dotenv import load_dotenv
 import tiktoken
@@ -19,6 +21,13 @@ import PyPDF2
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Enhanced patterns for Arabic section headers and bullet points, compiled once at import
+SECTION_PATTERN = re.compile(r'(❖.*?|•.*?|[\u0600-\u06FF]+\s*[:：].*?)(?=❖|•|[\u0600-\u06FF]+\s*[:：]|\Z)', re.DOTALL)
+SECTION_TITLE_PATTERN = re.compile(r'(❖.*?|•.*?|[\u0600-\u06FF]+\s*[:：])(?=\s|$)')
+ARABIC_CHAR_PATTERN = re.compile(r'[\u0600-\u06FF]')
+
 # Initialize FastAPI app
 app = FastAPI(title="Company Policy RAG System", version="1.0.0")
 
@@ -39,6 +48,12 @@ supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_KEY")
 supabase_client: Client = create_client(supabase_url, supabase_key)
 
+# Rows per bulk insert into the chunks table (each row carries a 1536-float embedding)
+CHUNK_INSERT_BATCH_SIZE = 100
+
+# Inputs per embeddings request (chunks are ~300 tokens, well under the per-request limit)
+EMBEDDING_BATCH_SIZE = 100
+
 # Models
 class DocumentMetadata(BaseModel):
     title: str
@@ -64,17 +79,26 @@ def get_embedding(text: str) -> list:
     )
     return response.data[0].embedding
 
-def num_tokens_from_string(string: str) -> int:
-    """Returns the number of tokens in a text string."""
+def get_embeddings(texts: List[str]) -> List[list]:
+    """Get embeddings for many texts, sending EMBEDDING_BATCH_SIZE inputs per API request"""
+    embeddings = []
+    for i in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+        response = openai_client.embeddings.create(
+            model="text-embedding-3-small",
+            input=texts[i:i + EMBEDDING_BATCH_SIZE]
+        )
+        embeddings.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+    return embeddings
+
+@lru_cache(maxsize=None)
+def get_encoding() -> tiktoken.Encoding:
+    """Returns the tokenizer for gpt-4o, resolved once per process."""
     try:
         # Try to use gpt-4o specific encoding
-        encoding = tiktoken.encoding_for_model("gpt-4o")
+        return tiktoken.encoding_for_model("gpt-4o")
     except KeyError:
         # Fall back to cl100k_base encoding used by gpt-4 and newer models if gpt-4o is not available
-        encoding = tiktoken.get_encoding("cl100k_base")
-    
-    num_tokens = len(encoding.encode(string))
-    return num_tokens
+        return tiktoken.get_encoding("cl100k_base")
 
 def chunk_text(text: str, chunk_size: int = 300, overlap: int = 100) -> List[Dict[str, Any]]:
     """
@@ -83,10 +107,9 @@ def chunk_text(text: str, chunk_size: int = 300, overlap: int = 100) -> List[Dic
     Returns a list of dictionaries with content and metadata
     """
     chunks = []
+    encoding = get_encoding()
     
-    # Enhanced pattern for Arabic section headers and bullet points
-    section_pattern = r'(❖.*?|•.*?|[\u0600-\u06FF]+\s*[:：].*?)(?=❖|•|[\u0600-\u06FF]+\s*[:：]|\Z)'
-    sections = re.findall(section_pattern, text, re.DOTALL)
+    sections = SECTION_PATTERN.findall(text)
     
     if not sections:  # If no sections found, create chunks by paragraphs
         paragraphs = text.split('\n\n')
@@ -94,12 +117,6 @@ def chunk_text(text: str, chunk_size: int = 300, overlap: int = 100) -> List[Dic
             if not paragraph.strip():
                 continue
                 
-            # Get encoding for the model
-            try:
-                encoding = tiktoken.encoding_for_model("gpt-4o")
-            except KeyError:
-                encoding = tiktoken.get_encoding("cl100k_base")
-                
             para_tokens = encoding.encode(paragraph)
             
             # If paragraph is small enough, keep it as one chunk
@@ -131,15 +148,9 @@ def chunk_text(text: str, chunk_size: int = 300, overlap: int = 100) -> List[Dic
             section = section.strip()
             
             # Extract section title - enhanced for Arabic
-            title_match = re.match(r'(❖.*?|•.*?|[\u0600-\u06FF]+\s*[:：])(?=\s|$)', section)
+            title_match = SECTION_TITLE_PATTERN.match(section)
             section_title = title_match.group(1).strip() if title_match else f"Section {section_idx + 1}"
             
-            # Get encoding for the model
-            try:
-                encoding = tiktoken.encoding_for_model("gpt-4o")
-            except KeyError:
-                encoding = tiktoken.get_encoding("cl100k_base")
-                
             section_tokens = encoding.encode(section)
             
             # If section is small enough, keep it as one chunk
@@ -175,40 +186,44 @@ def chunk_text(text: str, chunk_size: int = 300, overlap: int = 100) -> List[Dic
 def extract_text_from_pdf(file_bytes: bytes) -> str:
     """Extract text from PDF file"""
     pdf_reader = PyPDF2.PdfReader(BytesIO(file_bytes))
-    text = ""
+    page_texts = []
     for page in pdf_reader.pages:
         extracted_text = page.extract_text()
         if extracted_text:
-            text += extracted_text + "\n\n"
-    return text
+            page_texts.append(extracted_text + "\n\n")
+    return "".join(page_texts)
+
+@lru_cache(maxsize=1024)
+def translate_query_to_arabic(query: str) -> str:
+    """Translate a query to Arabic (cached per query; failures are raised and not cached)"""
+    response = openai_client.chat.completions.create(
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": "You are a translator. Translate the following text to Arabic."},
+            {"role": "user", "content": query}
+        ],
+        temperature=0
+    )
+    return response.choices[0].message.content
 
 def translate_query_if_needed(query: str, target_language: str = "ar") -> str:
     """Translate query to the document language if needed"""
     # Detect if query is not in Arabic
-    is_arabic = any('\u0600' <= c <= '\u06FF' for c in query)
+    is_arabic = ARABIC_CHAR_PATTERN.search(query) is not None
     
     if not is_arabic and target_language == "ar":
         try:
-            response = openai_client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are a translator. Translate the following text to Arabic."},
-                    {"role": "user", "content": query}
-                ],
-                temperature=0
-            )
-            translated_query = response.choices[0].message.content
-            return translated_query
+            return translate_query_to_arabic(query)
         except Exception as e:
-            print(f"Translation error: {e}")
+            logger.warning("Translation error: %s", e)
             return query
     return query
 
 def translate_response_if_needed(response: str, query_language: str) -> str:
     """Translate response to query language if needed"""
     # Detect if response is in Arabic but query is not
-    is_response_arabic = any('\u0600' <= c <= '\u06FF' for c in response)
-    is_query_arabic = any('\u0600' <= c <= '\u06FF' for c in query_language)
+    is_response_arabic = ARABIC_CHAR_PATTERN.search(response) is not None
+    is_query_arabic = ARABIC_CHAR_PATTERN.search(query_language) is not None
     
     if is_response_arabic and not is_query_arabic:
         try:
@@ -223,13 +238,13 @@ def translate_response_if_needed(response: str, query_language: str) -> str:
             translated_response = response.choices[0].message.content
             return translated_response
         except Exception as e:
-            print(f"Translation error: {e}")
+            logger.warning("Translation error: %s", e)
             return response
     return response
 
 # Routes
 @app.post("/upload-policy-document/")
-async def upload_policy_document(
+def upload_policy_document(
     file: UploadFile = File(...),
     metadata: str = Form(None)  # Make metadata optional
 ):
@@ -252,7 +267,7 @@ async def upload_policy_document(
                 raise HTTPException(status_code=400, detail="Invalid metadata JSON format")
         
         # Process PDF
-        contents = await file.read()
+        contents = file.file.read()
         text = extract_text_from_pdf(contents)
         
         if not text:
@@ -272,18 +287,23 @@ async def upload_policy_document(
         # Chunk text and create embeddings
         chunks = chunk_text(text)
         
-        # Add chunks to database
+        # Embed each distinct chunk content only once, in batched requests;
+        # repeated headers and boilerplate paragraphs reuse the same embedding
+        unique_contents = list(dict.fromkeys(chunk["content"] for chunk in chunks))
+        embeddings = dict(zip(unique_contents, get_embeddings(unique_contents)))
+        
+        chunk_rows = []
         for chunk in chunks:
-            embedding = get_embedding(chunk["content"])
-            
-            chunk_data = {
+            chunk_rows.append({
                 "document_id": document_id,
                 "content": chunk["content"],
-                "embedding": embedding,
+                "embedding": embeddings[chunk["content"]],
                 "metadata": chunk["metadata"]
-            }
-            
-            supabase_client.table("chunks").insert(chunk_data).execute()
+            })
+        
+        # Add chunks to database in bulk inserts instead of one request per chunk
+        for i in range(0, len(chunk_rows), CHUNK_INSERT_BATCH_SIZE):
+            supabase_client.table("chunks").insert(chunk_rows[i:i + CHUNK_INSERT_BATCH_SIZE]).execute()
         
         return {"message": f"Successfully processed document with {len(chunks)} chunks", "document_id": document_id}
     
@@ -291,20 +311,21 @@ async def upload_policy_document(
         raise HTTPException(status_code=500, detail=f"Failed to process document: {str(e)}")
 
 @app.post("/query/", response_model=QueryResponse)
-async def query_document(request: QueryRequest):
+def query_document(request: QueryRequest):
     """Query the company policy using either RAG or full-context approach"""
     start_time = time.time()
     original_query = request.query
     
     try:
-        # Get all documents (should only be one in this case)
-        documents_result = supabase_client.table("documents").select("*").execute()
+        # Get the policy document (should only be one in this case); the full
+        # text is only transferred for the full_context approach, in the same request
+        columns = "language, full_text" if request.approach == "full_context" else "language"
+        documents_result = supabase_client.table("documents").select(columns).limit(1).execute()
         
         if not documents_result.data:
             raise HTTPException(status_code=404, detail="No policy document found in the database")
         
         document = documents_result.data[0]
-        document_id = document["id"]
         document_language = document.get("language", "ar")
         
         # Translate query if needed
@@ -396,9 +417,9 @@ async def query_document(request: QueryRequest):
             }
         elif request.approach == "full_context":
             # Full context approach - read from full_text column
-            document_result = supabase_client.table("documents").select("full_text").eq("id", document_id).execute()
+            full_text = document.get("full_text")
             
-            if not document_result.data or not document_result.data[0].get("full_text"):
+            if not full_text:
                 response = "لم يتم العثور على محتوى لسياسة الشركة."
                 if document_language != "ar":
                     response = "No content found for the company policy."
@@ -409,20 +430,14 @@ async def query_document(request: QueryRequest):
                     "processing_time": time.time() - start_time
                 }
             
-            # Get full text directly from documents table
-            full_text = document_result.data[0]["full_text"]
-            
             # Check token count and truncate if needed
-            token_count = num_tokens_from_string(full_text)
+            encoding = get_encoding()
+
+            # Encode once and reuse the tokens for both the count and the truncation
+            tokens = encoding.encode(full_text)
             max_tokens = 120000  # GPT-4o context limit
-            
-            if token_count > max_tokens - 1000:  # Leave room for query and response
-                try:
-                    encoding = tiktoken.encoding_for_model("gpt-4o")
-                except KeyError:
-                    encoding = tiktoken.get_encoding("cl100k_base")
-                    
-                tokens = encoding.encode(full_text)
+
+            if len(tokens) > max_tokens - 1000:  # Leave room for query and response
                 full_text = encoding.decode(tokens[:max_tokens - 1000])
             
             # Generate response with GPT-4o
@@ -456,7 +471,7 @@ async def query_document(request: QueryRequest):
         raise HTTPException(status_code=500, detail=f"Query processing failed: {str(e)}")
 
 @app.get("/document-info/")
-async def get_document_info():
+def get_document_info():
     """Get information about the uploaded policy document"""
     try:
         document_result = supabase_client.table("documents").select("*").execute()
@@ -466,18 +481,18 @@ async def get_document_info():
         
         document = document_result.data[0]
         
-        # Get chunk count
-        chunks_result = supabase_client.table("chunks").select("id").eq("document_id", document["id"]).execute()
+        # Get chunk count from the server instead of downloading every chunk id
+        chunks_result = supabase_client.table("chunks").select("id", count="exact").eq("document_id", document["id"]).limit(1).execute()
         
         return {
             "document": document,
-            "chunk_count": len(chunks_result.data) if chunks_result.data else 0
+            "chunk_count": chunks_result.count or 0
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get document info: {str(e)}")
 
 @app.delete("/reset-database/")
-async def reset_database():
+def reset_database():
     """Reset the database by removing all documents and chunks"""
     try:
         # Delete all chunks first (due to foreign key constraints)